@@ -1,21 +1,55 @@
 "XY Screens Unit Tests."
 import asyncio
+import atexit
 import logging
+import os
+import time
 
+# Set XYSCREENS_LOG to DEBUG to see what the library is doing while testing.
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(filename)s:%(lineno)d %(message)s",
-    level=logging.DEBUG,
+    level=os.environ.get("XYSCREENS_LOG", "WARNING"),
 )
 
+# Scales the time of the tests that run in real time, 0.1 runs these tests 10 times faster.
+TIME_SCALE = float(os.environ.get("XYSCREENS_TIME_SCALE", "1.0"))
+
+_asyncio_sleep = asyncio.sleep
+
+
+async def _scaled_sleep(delay, result=None):
+    return await _asyncio_sleep(delay * TIME_SCALE, result)
+
+
+def _scaled_clock() -> int:
+    return int(time.monotonic_ns() / TIME_SCALE)
+
+
+# The clock to give to the screens in tests that run in real time.
+if TIME_SCALE == 1.0:
+    CLOCK = time.monotonic_ns
+else:
+    CLOCK = _scaled_clock
+    asyncio.sleep = _scaled_sleep
+
+# How far off a position measured in real time may be. Scheduling delays count for more when the
+# time is scaled, so is the allowed difference.
+POSITION_DELTA = 0.3 / min(TIME_SCALE, 1.0)
+
+# A single event loop shared by all async test cases.
+_LOOP = asyncio.new_event_loop()
+atexit.register(_LOOP.close)
+
+
+def run_async(coro):
+    "Runs a coroutine on the shared event loop"
+    return _LOOP.run_until_complete(coro)
+
 
 def async_test(coro):
-    "Creates an event loop wrapper around an async test case"
+    "Runs an async test case on the shared event loop"
 
     def wrapper(*args, **kwargs):
-        loop = asyncio.new_event_loop()
-        try:
-            return asyncio.run(coro(*args, **kwargs))
-        finally:
-            loop.close()
+        return run_async(coro(*args, **kwargs))
 
     return wrapper
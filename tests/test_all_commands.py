@@ -1,26 +1,39 @@
 import asyncio
+import os
 import unittest
 
 from xyscreens import XYScreens
 
 from . import async_test
 
-_SERIAL_PORT = "/dev/tty.wchusbserial110"
+# The serial port the RS-485 interface is connected to, the test only runs when it is set as it
+# needs the actual hardware. For instance /dev/tty.wchusbserial110
+_SERIAL_PORT = os.environ.get("XYSCREENS_SERIAL_PORT")
 _ADDRESS = bytes.fromhex("AAEEEE")
+# Time in seconds to observe the device after each command. The devices don't send any response,
+# so lower this when no movement has to be observed, for instance when only testing the protocol.
+_PROBE_INTERVAL = float(os.environ.get("XYSCREENS_PROBE_INTERVAL", "5"))
 
 
+@unittest.skipUnless(_SERIAL_PORT, "XYSCREENS_SERIAL_PORT is not set")
 class TestXYScreens(unittest.TestCase):
     """Unit test for the XYScreens library"""
 
     @async_test
     async def test_all_commands(self):
+        assert _SERIAL_PORT is not None
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60)
-        for i in range(256):
-            print(f"Trying command {i.to_bytes(1).hex()}")
-            command = b"\xFF" + _ADDRESS + i.to_bytes(1)
-            await screen._async_send_command(command)
-            await asyncio.sleep(5)
-            await screen.async_stop()
+        try:
+            # The command frame is built once, only the last byte changes per command.
+            command = bytearray(b"\xFF" + _ADDRESS + b"\x00")
+            for i in range(256):
+                command[-1] = i
+                print(f"Trying command {i:02x}")
+                await screen.async_send_raw_command(bytes(command))
+                await asyncio.sleep(_PROBE_INTERVAL)
+                await screen.async_stop()
+        finally:
+            await screen.async_close()
 
 
 if __name__ == "__main__":
@@ -8,21 +8,70 @@ Created on 16 Nov 2022
 # pylint: disable=too-many-public-methods
 
 import asyncio
-import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock, patch
 
-from xyscreens import XYScreens, XYScreensState
+import serial
 
-from . import async_test
+from xyscreens import XYScreens, XYScreensCommands, XYScreensConnectionError, XYScreensState
+
+from . import CLOCK, POSITION_DELTA, async_test, run_async
 
 _SERIAL_PORT = "/dev/tty.usbserial-110"
 _ADDRESS = bytes.fromhex("AAEEEE")
 
 
+class FakeClock:
+    """Clock which only advances when told to, returns the time in nanoseconds."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> int:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        "Advances the clock with the given amount of seconds."
+        self.now += int(seconds * 1000000000)
+
+
+async def _wait_for_state(screen: XYScreens, state: XYScreensState, timeout: float) -> None:
+    "Waits till the screen reports the given state to its callbacks."
+    reached = asyncio.Event()
+
+    def callback(new_state: XYScreensState, _position: float) -> None:
+        if new_state is state:
+            reached.set()
+
+    screen.add_callback(callback)
+    await asyncio.wait_for(reached.wait(), timeout)
+
+
 class TestXYScreens(unittest.TestCase):
     """Unit test for the XYScreens library"""
 
+    def setUp(self):
+        # Replace the serial connections so the tests don't need the actual hardware. Every test
+        # gets its own mocks, so it only sees its own calls.
+        serial_patcher = patch("xyscreens.xyscreens.serial.Serial", autospec=True)
+        self._mock_serial = serial_patcher.start()
+        self.addCleanup(serial_patcher.stop)
+
+        self._mock_writer = Mock(spec=asyncio.StreamWriter)
+        self._mock_writer.is_closing.return_value = False
+        serial_asyncio_patcher = patch(
+            "xyscreens.xyscreens.serial_asyncio.open_serial_connection",
+            return_value=(Mock(spec=asyncio.StreamReader), self._mock_writer),
+        )
+        serial_asyncio_patcher.start()
+        self.addCleanup(serial_asyncio_patcher.stop)
+
+    def _async_screen(self, *args, **kwargs) -> XYScreens:
+        "Creates a screen for an async test, which is closed when the test finishes."
+        screen = XYScreens(*args, **kwargs)
+        self.addCleanup(lambda: run_async(screen.async_close()))
+        return screen
+
     def test_constructor(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60)
         self.assertIsNotNone(screen)
@@ -38,17 +87,17 @@ class TestXYScreens(unittest.TestCase):
     def test_constructor_up(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, position=0.0)
         self.assertIs(XYScreensState.UP, screen.state())
-        self.assertIs(0.0, screen.position())
+        self.assertEqual(0.0, screen.position())
 
     def test_constructor_down(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, position=100.0)
         self.assertIs(XYScreensState.DOWN, screen.state())
-        self.assertIs(100.0, screen.position())
+        self.assertEqual(100.0, screen.position())
 
     def test_constructor_stopped(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, position=50.0)
         self.assertIs(XYScreensState.STOPPED, screen.state())
-        self.assertIs(50.0, screen.position())
+        self.assertEqual(50.0, screen.position())
 
     def test_constructor_negative_position(self):
         self.assertRaises(
@@ -63,21 +112,55 @@ class TestXYScreens(unittest.TestCase):
     def test_down(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
         self.assertTrue(screen.down())
+        self._mock_serial.return_value.write.assert_called_with(b"\xFF" + _ADDRESS + b"\xEE")
+
+    def test_down_repeated(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        self.assertTrue(screen.down())
+        self._mock_serial.return_value.write.reset_mock()
+        self.assertFalse(screen.down())
+        self._mock_serial.return_value.write.assert_not_called()
 
     def test_up(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60, 100)
         self.assertTrue(screen.up())
 
     def test_stop(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60, clock=clock)
         screen.down()
-        time.sleep(1)
+        clock.advance(1)
         self.assertTrue(screen.stop())
 
+    def test_close(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        screen.down()
+        screen.close()
+        self._mock_serial.return_value.close.assert_called_once()
+
+    def test_write_timeout(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        self._mock_serial.return_value.write.side_effect = serial.SerialTimeoutException()
+        self.assertRaises(XYScreensConnectionError, screen.down)
+        self.assertEqual(XYScreensState.UP, screen.state())
+
+    def test_write_retry(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        self._mock_serial.return_value.write.side_effect = [serial.SerialException(), None]
+        self.assertTrue(screen.down())
+        self.assertEqual(2, self._mock_serial.call_count)
+
+    def test_write_error(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        self._mock_serial.return_value.write.side_effect = serial.SerialException()
+        self.assertRaises(XYScreensConnectionError, screen.down)
+        self.assertEqual(XYScreensState.UP, screen.state())
+
     def test_state_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=clock)
         screen.up()
-        time.sleep(10)
+        clock.advance(10)
         self.assertIs(XYScreensState.UP, screen.state())
 
     def test_state_closing(self):
@@ -86,9 +169,10 @@ class TestXYScreens(unittest.TestCase):
         self.assertIs(XYScreensState.UPWARD, screen.state())
 
     def test_state_stopped(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
         screen.down()
-        time.sleep(5)
+        clock.advance(5)
         screen.stop()
         self.assertIs(XYScreensState.STOPPED, screen.state())
 
@@ -98,103 +182,305 @@ class TestXYScreens(unittest.TestCase):
         self.assertIs(XYScreensState.DOWNWARD, screen.state())
 
     def test_state_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
         screen.down()
-        time.sleep(10)
+        clock.advance(10)
         self.assertIs(XYScreensState.DOWN, screen.state())
 
     def test_position_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=clock)
         screen.up()
-        time.sleep(10)
+        clock.advance(10)
         self.assertEqual(0.0, screen.position())
 
     def test_position_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
         screen.down()
-        time.sleep(10)
+        clock.advance(10)
         self.assertEqual(100.0, screen.position())
 
     def test_position_halfway(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
         screen.down()
-        time.sleep(5)
+        clock.advance(5)
         self.assertAlmostEqual(50.0, screen.position(), delta=0.3)
 
+    def test_time_to_end_position(self):
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 20, clock=clock)
+        self.assertEqual(0.0, screen.time_to_end_position())
+        screen.down()
+        clock.advance(4)
+        self.assertAlmostEqual(6.0, screen.time_to_end_position())
+        screen.up()
+        self.assertAlmostEqual(8.0, screen.time_to_end_position())
+
     def test_change_direction_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=clock)
         screen.up()
-        time.sleep(5)
+        clock.advance(5)
         screen.down()
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.DOWNWARD, state)
         self.assertAlmostEqual(50.0, position, delta=0.6)
 
     def test_change_direction_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
         screen.down()
-        time.sleep(5)
+        clock.advance(5)
         screen.up()
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.UPWARD, state)
         self.assertAlmostEqual(50.0, position, delta=0.6)
 
     def test_set_position_downward(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
-        screen.set_position(50.0)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
+        with patch("time.sleep", clock.advance):
+            screen.set_position(50.0)
+        (state, position) = screen.update_status()
+        self.assertIs(XYScreensState.STOPPED, state)
+        self.assertAlmostEqual(50.0, position, delta=0.3)
+
+    def test_set_position_while_moving(self):
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
+        screen.down()
+        self._mock_serial.return_value.write.reset_mock()
+        with patch("time.sleep", clock.advance):
+            self.assertTrue(screen.set_position(50.0))
+        # Only the stop command is sent, the screen was already moving down.
+        self._mock_serial.return_value.write.assert_called_once_with(b"\xFF" + _ADDRESS + b"\xCC")
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.STOPPED, state)
         self.assertAlmostEqual(50.0, position, delta=0.3)
 
     def test_set_position_upward(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100.0)
-        screen.set_position(50.0)
+        clock = FakeClock()
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100.0, clock=clock)
+        with patch("time.sleep", clock.advance):
+            screen.set_position(50.0)
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.STOPPED, state)
         self.assertAlmostEqual(50.0, position, delta=0.3)
 
     @async_test
     async def test_async_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 5, 5)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 5, 5, clock=CLOCK)
         callback = Mock()
         screen.add_callback(callback)
         self.assertTrue(await screen.async_down())
-        await asyncio.sleep(5.1)
+        self._mock_writer.write.assert_called_with(b"\xFF" + _ADDRESS + b"\xEE")
+        self._mock_writer.transport.set_write_buffer_limits.assert_called_with(high=0)
+        await _wait_for_state(screen, XYScreensState.DOWN, 6.0)
         callback.assert_called_with(XYScreensState.DOWN, 100.0)
 
     @async_test
     async def test_async_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 5, 5, 100)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 5, 5, 100, clock=CLOCK)
         callback = Mock()
         screen.add_callback(callback)
         self.assertTrue(await screen.async_up())
-        await asyncio.sleep(5.1)
+        await _wait_for_state(screen, XYScreensState.UP, 6.0)
         callback.assert_called_with(XYScreensState.UP, 0.0)
 
+    @async_test
+    async def test_async_unchanged_status(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=FakeClock())
+        callback = Mock()
+        screen.add_callback(callback)
+        await screen.async_stop()
+        # Give the event loop the chance to call the callbacks.
+        await asyncio.sleep(0)
+        callback.assert_called_once_with(XYScreensState.UP, 0.0)
+        # The screen isn't moving, so there is nothing new to report.
+        await screen.async_stop()
+        await asyncio.sleep(0)
+        callback.assert_called_once()
+
+    @async_test
+    async def test_async_add_callback_reports_status(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=FakeClock())
+        screen.add_callback(Mock())
+        await screen.async_stop()
+        await asyncio.sleep(0)
+        # A callback added later still gets the current status on the next update.
+        callback = Mock()
+        screen.add_callback(callback)
+        await screen.async_stop()
+        await asyncio.sleep(0)
+        callback.assert_called_once_with(XYScreensState.UP, 0.0)
+
+    @async_test
+    async def test_async_coroutine_callback(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+        callback = AsyncMock()
+        screen.add_callback(callback)
+        await screen.async_down()
+        await screen.async_stop()
+        await asyncio.sleep(0.1)
+        callback.assert_awaited_with(XYScreensState.STOPPED, screen.position())
+
+    @async_test
+    async def test_async_combined_write(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+        results = await asyncio.gather(screen.async_micro_down(), screen.async_micro_up())
+        self.assertEqual([True, True], results)
+        # Commands that are queued at the same time are written at once.
+        self._mock_writer.write.assert_called_once_with(
+            b"\xFF" + _ADDRESS + b"\xE9" + b"\xFF" + _ADDRESS + b"\xC9"
+        )
+
+    @async_test
+    async def test_async_batch_delay(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK, batch_delay=0.1)
+        micro_down = asyncio.create_task(screen.async_micro_down())
+        await asyncio.sleep(0.01)
+        # Commands that are queued within the batch delay are written at once.
+        self.assertTrue(await screen.async_micro_up())
+        self.assertTrue(await micro_down)
+        self._mock_writer.write.assert_called_once_with(
+            b"\xFF" + _ADDRESS + b"\xE9" + b"\xFF" + _ADDRESS + b"\xC9"
+        )
+
+    @async_test
+    async def test_async_batch_delay_stop(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK, batch_delay=60)
+        # The stop command doesn't wait for the batch delay.
+        await asyncio.wait_for(screen.async_stop(), 1.0)
+        self._mock_writer.write.assert_called_once_with(b"\xFF" + _ADDRESS + b"\xCC")
+
+    @async_test
+    async def test_async_disconnect_when_idle(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+        self.assertTrue(await screen.async_micro_down())
+        # Give the writer task the chance to finish.
+        await asyncio.sleep(0.1)
+        # Without commands to write the connection is closed, without having to call
+        # async_close(), and no tasks of the screen are left behind.
+        self._mock_writer.close.assert_called_once()
+        self.assertFalse(
+            [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        )
+
+    @async_test
+    async def test_async_write_error(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+        self._mock_writer.drain.side_effect = [ConnectionResetError(), None]
+        with self.assertRaises(XYScreensConnectionError):
+            await screen.async_micro_down()
+        self.assertTrue(await screen.async_micro_down())
+
+    @async_test
+    async def test_async_close_while_writing(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+        self._mock_writer.drain.side_effect = asyncio.Event().wait
+        command = asyncio.create_task(screen.async_micro_down())
+        await asyncio.sleep(0.1)
+        await screen.async_close()
+        with self.assertRaises(XYScreensConnectionError):
+            await asyncio.wait_for(command, 1.0)
+
+    def test_async_multiple_loops(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
+
+        async def micro_down() -> bool:
+            result = await asyncio.wait_for(screen.async_micro_down(), 1.0)
+            # Give the writer task the chance to wait for the next command.
+            await asyncio.sleep(0.1)
+            return result
+
+        # asyncio.run() uses a new event loop each time.
+        self.assertTrue(asyncio.run(micro_down()))
+        self.assertTrue(asyncio.run(micro_down()))
+
+    @async_test
+    async def test_async_wait_for_position(self):
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 5, 5, clock=CLOCK)
+        await screen.async_down()
+        await asyncio.wait_for(screen.async_wait_for_position(), 6.0)
+        self.assertIs(XYScreensState.DOWN, screen.state())
+
+    @async_test
+    async def test_async_set_position_after_close(self):
+        clock = FakeClock()
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=clock)
+        await screen.async_down()
+        await screen.async_close()
+        # The screen keeps moving down while the set position task is gone.
+        clock.advance(5)
+        self._mock_writer.write.reset_mock()
+        self.assertTrue(await screen.async_set_position(40.0))
+        self._mock_writer.write.assert_called_once_with(b"\xFF" + _ADDRESS + b"\xDD")
+        self.assertIs(XYScreensState.UPWARD, screen.state())
+
     @async_test
     async def test_async_stop(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, clock=CLOCK)
         await screen.async_down()
         await asyncio.sleep(1)
         self.assertTrue(await screen.async_stop())
 
+    @async_test
+    async def test_async_broadcast(self):
+        addresses = (_ADDRESS, bytes.fromhex("AAEEEF"))
+        screens = [
+            self._async_screen(_SERIAL_PORT, address, 60, 60, clock=CLOCK) for address in addresses
+        ]
+        self.assertTrue(await XYScreens.async_broadcast(screens, XYScreensCommands.down))
+        # Screens on the same serial port get their commands in a single write.
+        self._mock_writer.write.assert_called_once_with(
+            b"".join(b"\xFF" + address + b"\xEE" for address in addresses)
+        )
+        for screen in screens:
+            self.assertIs(XYScreensState.DOWNWARD, screen.state())
+        self.assertTrue(await XYScreens.async_broadcast(screens, XYScreensCommands.stop))
+        for screen in screens:
+            self.assertIs(XYScreensState.STOPPED, screen.state())
+
+    @async_test
+    async def test_async_broadcast_up(self):
+        clock = FakeClock()
+        screens = [
+            self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, 100.0, clock=clock),
+            self._async_screen(_SERIAL_PORT, bytes.fromhex("AAEEEF"), 10, 10, clock=clock),
+        ]
+        callback = Mock()
+        screens[0].add_callback(callback)
+        # Like async_up, the screen that is already up is stopped rather than moved.
+        self.assertFalse(await XYScreens.async_broadcast(screens, XYScreensCommands.up))
+        self._mock_writer.write.assert_called_once_with(
+            b"\xFF" + _ADDRESS + b"\xDD" + b"\xFF\xAA\xEE\xEF\xCC"
+        )
+        self.assertIs(XYScreensState.UPWARD, screens[0].state())
+        self.assertIs(XYScreensState.UP, screens[1].state())
+        # Starting to move is reported to the callbacks.
+        await asyncio.sleep(0)
+        callback.assert_called_with(XYScreensState.UPWARD, 100.0)
+
     @async_test
     async def test_async_state_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=CLOCK)
         await screen.async_up()
-        await asyncio.sleep(10.1)
+        await _wait_for_state(screen, XYScreensState.UP, 11.0)
         self.assertIs(XYScreensState.UP, screen.state())
 
     @async_test
     async def test_async_state_closing(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, 60, 100)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 60, 60, 100, clock=CLOCK)
         await screen.async_up()
         self.assertIs(XYScreensState.UPWARD, screen.state())
         await screen.async_stop()
 
     @async_test
     async def test_async_state_stopped(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
         await asyncio.sleep(5)
         await screen.async_stop()
@@ -202,90 +488,90 @@ class TestXYScreens(unittest.TestCase):
 
     @async_test
     async def test_async_state_downward(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
         self.assertIs(XYScreensState.DOWNWARD, screen.state())
         await screen.async_stop()
 
     @async_test
     async def test_async_state_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
-        await asyncio.sleep(10.1)
+        await _wait_for_state(screen, XYScreensState.DOWN, 11.0)
         self.assertIs(XYScreensState.DOWN, screen.state())
 
     @async_test
     async def test_async_position_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=CLOCK)
         await screen.async_up()
-        await asyncio.sleep(10.1)
+        await _wait_for_state(screen, XYScreensState.UP, 11.0)
         self.assertEqual(0.0, screen.position())
 
     @async_test
     async def test_async_position_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
-        await asyncio.sleep(10.1)
+        await _wait_for_state(screen, XYScreensState.DOWN, 11.0)
         self.assertEqual(100.0, screen.position())
 
     @async_test
     async def test_async_position_halfway(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
         await asyncio.sleep(5)
-        self.assertAlmostEqual(50.0, screen.position(), delta=0.3)
+        self.assertAlmostEqual(50.0, screen.position(), delta=POSITION_DELTA)
         await screen.async_stop()
 
     @async_test
     async def test_async_change_direction_down(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, 100, clock=CLOCK)
         await screen.async_up()
         await asyncio.sleep(5)
         await screen.async_down()
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.DOWNWARD, state)
-        self.assertAlmostEqual(50.0, position, delta=0.3)
+        self.assertAlmostEqual(50.0, position, delta=POSITION_DELTA)
         await screen.async_stop()
 
     @async_test
     async def test_async_change_direction_up(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
         await asyncio.sleep(5)
         await screen.async_up()
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.UPWARD, state)
-        self.assertAlmostEqual(50.0, position, delta=0.3)
+        self.assertAlmostEqual(50.0, position, delta=POSITION_DELTA)
         await screen.async_stop()
 
     @async_test
     async def test_async_set_position_downward(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_set_position(50.0)
-        await asyncio.sleep(5.1)
+        await _wait_for_state(screen, XYScreensState.STOPPED, 6.0)
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.STOPPED, state)
-        self.assertAlmostEqual(50.0, position, delta=0.3)
+        self.assertAlmostEqual(50.0, position, delta=POSITION_DELTA)
 
     @async_test
     async def test_async_set_position_upward(self):
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10, 100.0)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, 100.0, clock=CLOCK)
         await screen.async_set_position(50.0)
-        await asyncio.sleep(5.1)
+        await _wait_for_state(screen, XYScreensState.STOPPED, 6.0)
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.STOPPED, state)
-        self.assertAlmostEqual(50.0, position, delta=0.3)
+        self.assertAlmostEqual(50.0, position, delta=POSITION_DELTA)
 
     @async_test
     async def test_async_set_position_stop(self):
         """Test stopping the screen while it is moving to a given position."""
-        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 10, 10)
+        screen = self._async_screen(_SERIAL_PORT, _ADDRESS, 10, 10, clock=CLOCK)
         await screen.async_down()
         await asyncio.sleep(5)
         await screen.async_stop()
         (state, position) = screen.update_status()
         self.assertIs(XYScreensState.STOPPED, state)
-        self.assertAlmostEqual(50.0, position, delta=0.3)
+        self.assertAlmostEqual(50.0, position, delta=POSITION_DELTA)
 
     def test_restore_position_up(self):
         screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60)
@@ -308,6 +594,26 @@ class TestXYScreens(unittest.TestCase):
         self.assertIs(XYScreensState.STOPPED, state)
         self.assertEqual(50.0, position)
 
+    def test_restore_position_almost_down(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60)
+        screen.restore_position(100.0 - 1e-12)
+        (state, position) = screen.update_status()
+        self.assertIs(XYScreensState.DOWN, state)
+        self.assertEqual(100.0, position)
+
+    def test_restore_position_past_down(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60)
+        screen.restore_position(100.0000001)
+        (state, position) = screen.update_status()
+        self.assertIs(XYScreensState.DOWN, state)
+        self.assertEqual(100.0, position)
+
+    def test_constructor_almost_up(self):
+        screen = XYScreens(_SERIAL_PORT, _ADDRESS, 60, position=-1e-12)
+        (state, position) = screen.update_status()
+        self.assertIs(XYScreensState.UP, state)
+        self.assertEqual(0.0, position)
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testConstructor']
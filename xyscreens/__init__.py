@@ -10,4 +10,4 @@ try:
     from ._version import __version__
 except ModuleNotFoundError:
     pass
-from .xyscreens import XYScreens, XYScreensConnectionError, XYScreensState
+from .xyscreens import XYScreens, XYScreensCommands, XYScreensConnectionError, XYScreensState
@@ -13,11 +13,12 @@ from xyscreens import XYScreens, XYScreensState
 _LOGGER = logging.getLogger(__name__)
 
 
+def _log_status(state: XYScreensState, position: float):
+    _LOGGER.info("%-8s: %5.1f %%", state, position)
+
+
 def _print_status(state: XYScreensState, position: float):
-    if _LOGGER.isEnabledFor(logging.DEBUG):
-        _LOGGER.info("%-8s: %5.1f %%", state, position)
-    else:
-        print(f"{state!s:8}: {position:5.1f} %", end="\r")
+    print(f"{state!s:8}: {position:5.1f} %", end="\r")
 
 
 async def main(port: str, address: bytes, wait: int, action: str):
@@ -28,35 +29,52 @@ async def main(port: str, address: bytes, wait: int, action: str):
     else:
         down_duration = wait
 
+    # Log the status when debugging, otherwise show the progress on a single line.
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        show_status = _log_status
+    else:
+        show_status = _print_status
+
+    # Assume the screen is down when it has to go up, and up otherwise.
+    screen = XYScreens(port, address, down_duration, position=100.0 if action == "up" else 0.0)
     try:
         if action == "up":
-            screen = XYScreens(port, address, down_duration, position=100.0)
             if not await screen.async_up():
                 return
 
+            last_status = None
             while wait > 0:
                 (state, position) = screen.update_status()
-                _print_status(state, position)
+                # Only print the status when the printed values change.
+                status = (state, round(position, 1))
+                if status != last_status:
+                    show_status(state, position)
+                    last_status = status
                 if state == XYScreensState.UP:
                     if _LOGGER.level <= logging.DEBUG:
                         print()
                     break
-                await asyncio.sleep(0.1)
+                # Don't sleep longer than needed to reach the end position.
+                await asyncio.sleep(min(0.1, screen.time_to_end_position()))
         elif action == "down":
-            screen = XYScreens(port, address, down_duration, position=0.0)
             if not await screen.async_down():
                 return
 
+            last_status = None
             while wait > 0:
                 (state, position) = screen.update_status()
-                _print_status(state, position)
+                # Only print the status when the printed values change.
+                status = (state, round(position, 1))
+                if status != last_status:
+                    show_status(state, position)
+                    last_status = status
                 if state == XYScreensState.DOWN:
                     if _LOGGER.level <= logging.DEBUG:
                         print()
                     break
-                await asyncio.sleep(0.1)
+                # Don't sleep longer than needed to reach the end position.
+                await asyncio.sleep(min(0.1, screen.time_to_end_position()))
         else:
-            screen = XYScreens(port, address, 1)
             match action:
                 case "stop":
                     await screen.async_stop()
@@ -69,6 +87,9 @@ async def main(port: str, address: bytes, wait: int, action: str):
     except KeyboardInterrupt:
         # Handle keyboard interrupt
         pass
+    finally:
+        # Also close the connection when the screen didn't accept the command.
+        await screen.async_close()
 
 
 if __name__ == "__main__":
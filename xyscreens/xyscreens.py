@@ -7,27 +7,37 @@ Created on 17 Nov 2022
 @author: Rogier van Staveren
 """
 
+# pylint: disable=too-many-lines
+
 import asyncio
 import logging
+import threading
 import time
 from enum import IntEnum
-from typing import Any, Tuple
+from typing import Any, Callable, Iterable, Tuple
 
 import serial
 import serial_asyncio_fast as serial_asyncio
 
 logger = logging.getLogger(__name__)
 
-background_tasks = set()
-
+# The serial connection settings used by the screens, 2400 baud 8N1.
+_SERIAL_SETTINGS: dict[str, Any] = {
+    "baudrate": 2400,
+    "bytesize": serial.EIGHTBITS,
+    "parity": serial.PARITY_NONE,
+    "stopbits": serial.STOPBITS_ONE,
+    "timeout": 1,
+    # Don't block forever when the device doesn't accept the command.
+    "write_timeout": 1,
+}
 
-def _add_background_task(task: asyncio.Task) -> None:
-    # Add task to the set. This creates a strong reference.
-    background_tasks.add(task)
+# Positions closer than this to an end position, on either side, are considered to be at that end
+# position. Covers the rounding noise of positions that were stored and restored as floats.
+_POSITION_TOLERANCE = 1e-6
 
-    # To prevent keeping references to finished tasks forever, make each task remove its own
-    # reference from the set after completion:
-    task.add_done_callback(background_tasks.discard)
+# The maximum time in seconds between two position updates while moving to a target position.
+_MAX_POLL_INTERVAL = 0.5
 
 
 class XYScreensConnectionError(Exception):
@@ -49,33 +59,54 @@ class XYScreensCommands:
     _MICRO_DOWN = b"\xE9"
     _PROGRAM = b"\xAA"
 
+    __slots__ = ("_address", "_up", "_stop", "_down", "_micro_up", "_micro_down", "_program")
+
     def __init__(self, address: bytes):
         self._address = address
 
+        # The commands are the same for the lifetime of the object, build them only once.
+        prefix = XYScreensCommands._PREFIX + address
+        self._up = prefix + XYScreensCommands._UP
+        self._stop = prefix + XYScreensCommands._STOP
+        self._down = prefix + XYScreensCommands._DOWN
+        self._micro_up = prefix + XYScreensCommands._MICRO_UP
+        self._micro_down = prefix + XYScreensCommands._MICRO_DOWN
+        self._program = prefix + XYScreensCommands._PROGRAM
+
     def up(self) -> bytes:
         "Returns the command needed to start moving the screen up."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._UP
+        return self._up
 
     def micro_up(self) -> bytes:
         "Returns the command needed to move the screen up one step."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._MICRO_UP
+        return self._micro_up
 
     def stop(self) -> bytes:
         "Returns the command needed for stopping the screen."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._STOP
+        return self._stop
 
     def down(self) -> bytes:
         "Returns the command needed to start moving the screen down."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._DOWN
+        return self._down
 
     def micro_down(self) -> bytes:
         "Returns the command needed to move the screen down one step."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._MICRO_DOWN
+        return self._micro_down
 
     def program(self) -> bytes:
         "Returns the command needed for programming the screen address."
-        return XYScreensCommands._PREFIX + self._address + XYScreensCommands._PROGRAM
+        return self._program
+
 
+# The commands that can be sent to multiple screens at once using XYScreens.async_broadcast, with
+# the position they move the screens to.
+_BROADCAST_COMMANDS: dict[Callable[[XYScreensCommands], bytes], float | None] = {
+    XYScreensCommands.up: 0.0,
+    XYScreensCommands.down: 100.0,
+    XYScreensCommands.stop: None,
+    XYScreensCommands.micro_up: None,
+    XYScreensCommands.micro_down: None,
+}
 
 class XYScreensState(IntEnum):
     "The different states the screen can be."
@@ -93,39 +124,105 @@ class XYScreensState(IntEnum):
 
     def __str__(self) -> str:
         "Human readable states."
-        return {
-            self.STOPPED: "Stopped",
-            self.UP: "Up",
-            self.UPWARD: "Upward",
-            self.DOWNWARD: "Downward",
-            self.DOWN: "Down",
-        }[self]
+        return _STATE_NAMES[self]
+
+
+# Human readable names of the states, indexed by state value.
+_STATE_NAMES = ("Stopped", "Up", "Upward", "Downward", "Down")
+
+
+# The states bound to module level names, which are faster to look up than enum members.
+_STATE_STOPPED = XYScreensState.STOPPED
+_STATE_UP = XYScreensState.UP
+_STATE_UPWARD = XYScreensState.UPWARD
+_STATE_DOWNWARD = XYScreensState.DOWNWARD
+_STATE_DOWN = XYScreensState.DOWN
+
+# The states in which the screen is moving.
+_MOVING_STATES = (_STATE_UPWARD, _STATE_DOWNWARD)
+# The states in which the screen is at one of its end positions.
+_END_STATES = (_STATE_UP, _STATE_DOWN)
+# The states in which the screen is moving up or is up.
+_UP_STATES = (_STATE_UPWARD, _STATE_UP)
+# The states in which the screen is moving down or is down.
+_DOWN_STATES = (_STATE_DOWNWARD, _STATE_DOWN)
 
 
 class XYScreens:
     "XYScreens class for controlling XY Screens projector screens and projector lifts."
 
     # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-public-methods
+    # All attributes are known up front, slots make them smaller and faster to access.
+    __slots__ = (
+        "_serial_port",
+        "_up_duration",
+        "_down_duration",
+        "_up_speed",
+        "_down_speed",
+        "_commands",
+        "_state",
+        "_position",
+        "_end_position_time",
+        "_clock",
+        "_callbacks",
+        "_last_emitted",
+        "_set_position_task",
+        "_background_tasks",
+        "_connection",
+        "_lock",
+        "_writer",
+        "_command_queue",
+        "_writer_task",
+        "_loop",
+        "_batch_delay",
+    )
+
     # The serial port where the RS-485 interface and screen is connected to.
-    _serial_port: str | None = None
+    _serial_port: str
     # The amount of time in seconds it takes the screen to close from the fully-open state.
     _up_duration: float
     # The amount of time in seconds it takes the screen to open up from the fully-closed state.
     _down_duration: float
+    # The percentage the screen moves up per nanosecond.
+    _up_speed: float
+    # The percentage the screen moves down per nanosecond.
+    _down_speed: float
     # The commands that apply for this screen
     _commands: XYScreensCommands
 
-    # Current state of the screen. Defaults to Up when object is created.
-    _state: XYScreensState = XYScreensState.UP
+    # Current state of the screen.
+    _state: XYScreensState
     # Position of the screen where 0.0 is totally up and 100.0 is fully down.
-    _position: float = 0.0
-    # Timestamp when the position was last recomputed
-    _last_recompute_time: int = 0
-
-    # List of callbacks which need to be called when the screen status changes.
-    _callbacks: list[Any] | None = None
+    _position: float
+    # Timestamp when the screen reaches the end position it is moving to.
+    _end_position_time: int
+    # The clock used to calculate the position of the screen, returns time in nanoseconds.
+    _clock: Callable[[], int]
+
+    # Callbacks which need to be called when the screen status changes.
+    _callbacks: Tuple[Any, ...]
+    # The state and rounded position last reported to the callbacks.
+    _last_emitted: Tuple[XYScreensState, float] | None
     # The task that handles the set position functionality in async mode.
-    _set_position_task: asyncio.Task | None = None
+    _set_position_task: asyncio.Task | None
+    # Strong references to the tasks of this screen, so they don't get garbage collected.
+    _background_tasks: set[asyncio.Task]
+    # The serial connection that is kept open in sync mode.
+    _connection: serial.Serial | None
+    # Makes sure only one thread at a time writes to the connection in sync mode.
+    _lock: threading.Lock
+    # The writer of the serial connection in async mode, open while the writer task runs.
+    _writer: asyncio.StreamWriter | None
+    # Commands waiting to be written in async mode, if they are urgent and the future to set the
+    # result on.
+    _command_queue: asyncio.Queue[tuple[bytes, bool, asyncio.Future]] | None
+    # The task that writes the queued commands in async mode, ends when the queue is empty.
+    _writer_task: asyncio.Task | None
+    # The event loop the async mode tasks, queue and connection belong to.
+    _loop: asyncio.AbstractEventLoop | None
+    # Time in seconds to wait for more commands to combine into a single write in async mode.
+    _batch_delay: float
 
     def __init__(
         self,
@@ -137,6 +234,10 @@ class XYScreens:
         ) = None,  # Duration in seconds for the screen to go up.
         position: float = 0.0,  # Position of the screen where 0.0 is totally up and 100.0 is
         # fully down.
+        *,
+        clock: Callable[[], int] = time.monotonic_ns,  # Clock returning the time in nanoseconds.
+        batch_delay: float = 0.0,  # Time in seconds to wait for more commands to combine into
+        # a single write in async mode.
     ):
         "Initialises the XYScreens object."
         # pylint: disable=too-many-arguments
@@ -147,9 +248,11 @@ class XYScreens:
         assert down_duration > 0.0
         assert up_duration is None or up_duration > 0.0
         assert address is not None
-        assert position >= 0.0
+        assert batch_delay >= 0.0
 
         self._serial_port = serial_port
+        self._clock = clock
+        self._batch_delay = batch_delay
         # Set the duration for the screen to go down.
         self._down_duration = down_duration
 
@@ -161,11 +264,27 @@ class XYScreens:
         else:
             self._up_duration = self._down_duration
 
+        # Precalculate the speed of the screen so the position can be calculated without division.
+        self._down_speed = 100.0 / (self._down_duration * 1000000000)
+        self._up_speed = 100.0 / (self._up_duration * 1000000000)
+
         # Set the initial position of the screen.
         self.restore_position(position)
+        self._end_position_time = 0
 
         self._commands = XYScreensCommands(address)
 
+        self._callbacks = ()
+        self._last_emitted = None
+        self._set_position_task = None
+        self._background_tasks = set()
+        self._connection = None
+        self._lock = threading.Lock()
+        self._writer = None
+        self._command_queue = None
+        self._writer_task = None
+        self._loop = None
+
     def restore_position(self, position: float) -> None:
         """
         Restores the position of the screen, mainly introduced to restore the screen state in Home
@@ -174,151 +293,319 @@ class XYScreens:
         Not to be used to move the screen to a position
         """
         # Make sure the given screen position is within the range of 0.0% to 100.0%
-        assert 0.0 <= position <= 100.0
-
-        self._position = position
+        assert -_POSITION_TOLERANCE <= position <= 100.0 + _POSITION_TOLERANCE
 
         # Define the current state of the screen based on the position of the screen. When the
         # screen position is set it is unknown if the screen is moving and in which direction.
+        # Positions within _POSITION_TOLERANCE of an end position count as that end position.
         # If screen position is 0.0% it's in a totally retracted position and the state is Up
-        if self._position == 0.0:
-            self._state = XYScreensState.UP
+        if position <= _POSITION_TOLERANCE:
+            self._state = _STATE_UP
+            self._position = 0.0
         # If screen position is 100.0% it's in a totally extended position and the state is Down
-        elif self._position == 100.0:
-            self._state = XYScreensState.DOWN
+        elif position >= 100.0 - _POSITION_TOLERANCE:
+            self._state = _STATE_DOWN
+            self._position = 100.0
         # If screen position is anywhere in between 0.0% and 100.0% the state is Stopped
         else:
-            self._state = XYScreensState.STOPPED
-
-        self._last_recompute_time = time.time_ns()
+            self._state = _STATE_STOPPED
+            self._position = position
 
     def add_callback(self, callback):
         """
         Adds an Event Occurred Callback to the UNii.
         """
 
-        if self._callbacks is None:
-            self._callbacks = []
+        # Replace rather than modify the callbacks, so callbacks that are being called are not
+        # affected.
+        self._callbacks = self._callbacks + (callback,)
+        # Make sure the new callback gets the current status on the next update.
+        self._last_emitted = None
 
-        self._callbacks.append(callback)
+    def _get_connection(self) -> serial.Serial:
+        # Reuse the connection to the device, it's dropped when an error occurs.
+        if self._connection is not None:
+            return self._connection
 
-    def _send_command(self, command: bytes) -> bool:
         try:
             # Create the connection instance.
-            connection = serial.Serial(
-                port=self._serial_port,
-                baudrate=2400,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=1,
-            )
+            self._connection = serial.Serial(port=self._serial_port, **_SERIAL_SETTINGS)
         except serial.SerialException as ex:
             raise XYScreensConnectionError(
                 f"Unable to connect to device {self._serial_port}"
             ) from ex
         logger.debug("Device %s connected", self._serial_port)
 
-        try:
-            # Open the connection.
-            if not connection.is_open:
-                connection.open()
+        return self._connection
 
-            # Send the command.
+    def _write(self, command: bytes) -> None:
+        connection = self._get_connection()
+
+        # Send the command.
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
             logger.debug("Sending: 0x%s", command.hex())
-            connection.write(command)
-            connection.flush()
-            logger.info("Command successfully sent")
+        connection.write(command)
+        if debug:
+            logger.debug("Command successfully sent")
 
-            # Close the connection.
-            connection.close()
+    def _send_command(self, command: bytes) -> bool:
+        with self._lock:
+            try:
+                self._write(command)
+            except serial.SerialTimeoutException as ex:
+                # Drop the connection so it gets reopened on the next command.
+                self.close()
+                raise XYScreensConnectionError(
+                    f"Timeout while writing to device {self._serial_port}"
+                ) from ex
+            except serial.SerialException:
+                # The connection might have gone stale, for instance because the serial adapter
+                # was reconnected. Reconnect and try once more.
+                logger.debug("Error while writing to device %s, reconnecting", self._serial_port)
+                self.close()
+                try:
+                    self._write(command)
+                except serial.SerialException as ex:
+                    # Drop the connection so it gets reopened on the next command.
+                    self.close()
+                    raise XYScreensConnectionError(
+                        f"Error while writing to device {self._serial_port}"
+                    ) from ex
 
-            return True
-        except serial.SerialException as ex:
-            raise XYScreensConnectionError(
-                f"Error while writing to device {self._serial_port}"
-            ) from ex
+        return True
 
-        return False
+    def close(self) -> None:
+        "Closes the connection to the device used by the synchronous methods."
+        if self._connection is None:
+            return
 
-    async def _async_send_command(self, command: bytes) -> bool:
-        writer: asyncio.StreamWriter
+        connection = self._connection
+        self._connection = None
         try:
-            _, writer = await serial_asyncio.open_serial_connection(
-                url=self._serial_port,
-                baudrate=2400,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=1,
+            connection.close()
+        except serial.SerialException:
+            logger.debug("Error while closing device %s", self._serial_port)
+        logger.debug("Device %s disconnected", self._serial_port)
+
+    async def _async_get_writer(self) -> asyncio.StreamWriter:
+        # Reuse the connection to the device if it is still open.
+        if self._writer is not None and not self._writer.is_closing():
+            return self._writer
+
+        try:
+            _, self._writer = await serial_asyncio.open_serial_connection(
+                url=self._serial_port, **_SERIAL_SETTINGS
             )
         except serial.SerialException as ex:
             raise XYScreensConnectionError(
                 f"Unable to connect to device {self._serial_port}"
             ) from ex
+        # Without buffering, drain() only returns once the command has been handed to the device.
+        self._writer.transport.set_write_buffer_limits(high=0)
         logger.debug("Device %s connected", self._serial_port)
 
-        try:
-            # Send the command.
-            logger.debug("Sending: 0x%s", command.hex())
-            writer.write(command)
-            await writer.drain()
-            logger.info("Command successfully sent")
+        return self._writer
 
-            # Close the connection.
-            writer.close()
-            await writer.wait_closed()
+    def _bind_loop(self) -> None:
+        # The tasks, queue and connection of the async mode belong to the event loop they were
+        # created in. When the screen is used from another event loop, for instance after
+        # asyncio.run() returned, start afresh.
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
 
-            return True
-        except serial.SerialException as ex:
+        self._loop = loop
+        self._set_position_task = None
+        self._background_tasks = set()
+        self._writer = None
+        self._command_queue = asyncio.Queue()
+        self._writer_task = None
+
+    async def _async_send_command(self, command: bytes, urgent: bool = False) -> bool:
+        # Urgent commands, like stop, are written without waiting for the batch delay.
+        self._bind_loop()
+        assert self._command_queue is not None
+
+        # Queue the command and wait till the writer task reports the result.
+        result = asyncio.get_running_loop().create_future()
+        self._command_queue.put_nowait((command, urgent, result))
+
+        # The writer task stops once all commands are written, start it again when needed.
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer_coroutine())
+            self._add_background_task(self._writer_task)
+
+        return await result
+
+    async def _writer_coroutine(self) -> None:
+        assert self._command_queue is not None
+
+        while not self._command_queue.empty():
+            command, urgent, result = self._command_queue.get_nowait()
+            commands = [command]
+            results = [result]
+
+            # Unless the commands get written, for instance because the task is cancelled while
+            # writing, the callers are told the connection was closed.
+            error: Exception | None = self._closed_error()
+            try:
+                # Give other commands the chance to be queued, at the cost of latency. Urgent
+                # commands don't wait, a delayed stop makes the screen overshoot its position.
+                if self._batch_delay > 0.0 and not urgent:
+                    await asyncio.sleep(self._batch_delay)
+
+                # Combine all commands that are waiting into a single write.
+                while not self._command_queue.empty():
+                    command, _, result = self._command_queue.get_nowait()
+                    commands.append(command)
+                    results.append(result)
+
+                await self._async_write(b"".join(commands))
+                error = None
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                # Don't hand the frame of this task to the callers with the exception, clearing
+                # the frames of the traceback would also end this task.
+                error = ex.with_traceback(None)
+            finally:
+                for result in results:
+                    # The caller might no longer be waiting for the result.
+                    if result.done():
+                        continue
+                    if error is None:
+                        result.set_result(True)
+                    else:
+                        result.set_exception(error)
+
+            if self._command_queue.empty():
+                # Only keep the connection open while there are commands to write. Commands that
+                # are queued while disconnecting are written before this task ends.
+                await self._async_disconnect()
+
+    async def _async_write(self, data: bytes) -> None:
+        writer = await self._async_get_writer()
+
+        try:
+            # Send the command(s).
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("Sending: 0x%s", data.hex())
+            writer.write(data)
+            await writer.drain()
+            if debug:
+                logger.debug("Command successfully sent")
+        except (serial.SerialException, OSError) as ex:
+            # Drop the connection so it gets reopened on the next command.
+            await self._async_disconnect()
             raise XYScreensConnectionError(
                 f"Error while writing to device {self._serial_port}"
             ) from ex
 
-        return False
+    async def _async_disconnect(self) -> None:
+        if self._writer is None:
+            return
+
+        writer = self._writer
+        self._writer = None
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (serial.SerialException, OSError):
+            logger.debug("Error while closing device %s", self._serial_port)
+        logger.debug("Device %s disconnected", self._serial_port)
+
+    def _closed_error(self) -> XYScreensConnectionError:
+        return XYScreensConnectionError(f"Connection to device {self._serial_port} closed")
+
+    def _add_background_task(self, task: asyncio.Task) -> None:
+        # Add task to the set. This creates a strong reference.
+        self._background_tasks.add(task)
+
+        # To prevent keeping references to finished tasks forever, make each task remove its own
+        # reference from the set after completion:
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def async_close(self) -> None:
+        "Closes the connection to the device used by the asynchronous methods."
+        self._bind_loop()
+
+        # Cancel the set position and writer tasks and wait for them to finish.
+        tasks = tuple(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._set_position_task = None
+        self._writer_task = None
+
+        # Fail any commands that didn't get written.
+        while self._command_queue is not None and not self._command_queue.empty():
+            _, _, result = self._command_queue.get_nowait()
+            if not result.done():
+                result.set_exception(self._closed_error())
+
+        await self._async_disconnect()
+
+        # Start afresh on the next command, which might be sent from another event loop.
+        self._command_queue = None
+        self._loop = None
 
     def update_status(self) -> Tuple[XYScreensState, float]:
         """
         Calculates and returns the status and position of the screen based on the direction the
         screen is moving.
         """
-        if self._state == XYScreensState.DOWNWARD:
-            direction = 1.0
-            action_duration = self._down_duration
-        elif self._state == XYScreensState.UPWARD:
-            direction = -1.0
-            action_duration = self._up_duration
-        else:
-            self._last_recompute_time = time.time_ns()
-            return (self._state, self._position)
-
-        now = time.time_ns()
-        time_delta = now - self._last_recompute_time
-        movement = direction * time_delta / (action_duration * 10000000)
-        position = self._position + movement
-        self._last_recompute_time = now
-
-        if position >= 100.0:
-            self._state = XYScreensState.DOWN
-            position = 100.0
-        if position <= 0.0:
-            self._state = XYScreensState.UP
-            position = 0.0
-
-        self._position = position
+        # Only the end position in the direction the screen is moving can be reached, so a single
+        # comparison is needed to know if the screen is done moving.
+        if self._state == _STATE_DOWNWARD:
+            remaining_time = self._end_position_time - self._clock()
+            if remaining_time <= 0:
+                self._state = _STATE_DOWN
+                self._position = 100.0
+            else:
+                self._position = 100.0 - remaining_time * self._down_speed
+        elif self._state == _STATE_UPWARD:
+            remaining_time = self._end_position_time - self._clock()
+            if remaining_time <= 0:
+                self._state = _STATE_UP
+                self._position = 0.0
+            else:
+                self._position = remaining_time * self._up_speed
 
         return (self._state, self._position)
 
     def _update_callbacks(self):
-        if self._callbacks is None:
+        state = self._state
+        position = self._position
+
+        # Only report to the callbacks when the state or the position visibly changed.
+        last_emitted = (state, round(position, 1))
+        if last_emitted == self._last_emitted:
             return
+        self._last_emitted = last_emitted
 
+        # Call the callbacks from the event loop, so slow callbacks don't delay the command that
+        # is about to be sent.
+        call_soon = asyncio.get_running_loop().call_soon
+        call_callback = self._call_callback
         for callback in self._callbacks:
-            try:
-                callback(self._state, self._position)
-            # pylint: disable=broad-exception-caught
-            except Exception:
-                logger.exception("Exception in callback: %s", callback)
+            call_soon(call_callback, callback, state, position)
+
+    def _call_callback(self, callback, state: XYScreensState, position: float) -> None:
+        try:
+            result = callback(state, position)
+            # Coroutine callbacks run as a task of the screen.
+            if asyncio.iscoroutine(result):
+                self._add_background_task(
+                    asyncio.create_task(self._async_await_callback(callback, result))
+                )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Exception in callback: %s", callback)
+
+    async def _async_await_callback(self, callback, coroutine) -> None:
+        try:
+            await coroutine
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Exception in callback: %s", callback)
 
     def program(self) -> bool:
         "Program the address of the screen."
@@ -328,18 +615,44 @@ class XYScreens:
         "Program the address of the screen."
         return await self._async_send_command(self._commands.program())
 
+    def send_raw_command(self, command: bytes) -> bool:
+        """
+        Sends a complete command, including prefix and address, to the screen as is.
+
+        Mainly introduced to discover commands, the state of the screen is not updated.
+        """
+        return self._send_command(command)
+
+    async def async_send_raw_command(self, command: bytes) -> bool:
+        """
+        Sends a complete command, including prefix and address, to the screen as is.
+
+        Mainly introduced to discover commands, the state of the screen is not updated.
+        """
+        return await self._async_send_command(command)
+
     def _post_up(self) -> bool:
-        if self._state not in (XYScreensState.UPWARD, XYScreensState.UP):
-            self.update_status()
-            self._state = XYScreensState.UPWARD
-            return True
+        state = self._state
+        if state in _UP_STATES:
+            return False
 
-        return False
+        # Only a screen that was moving down has a position that needs updating.
+        if state == _STATE_DOWNWARD:
+            self.update_status()
+        self._state = _STATE_UPWARD
+        self._last_emitted = None
+        # Calculate when the screen will be totally up.
+        self._end_position_time = self._clock() + int(self._position / self._up_speed)
+        return True
 
     # pylint: disable=C0103
     def up(self) -> bool:
         "Move the screen up."
 
+        # Don't repeat the command while the screen is already moving up.
+        if self._state == _STATE_UPWARD:
+            return False
+
         if self._send_command(self._commands.up()):
             return self._post_up()
 
@@ -361,14 +674,11 @@ class XYScreens:
         return await self._async_send_command(self._commands.micro_up())
 
     def _post_stop(self) -> bool:
-        if self._state not in (
-            XYScreensState.UP,
-            XYScreensState.DOWN,
-            XYScreensState.STOPPED,
-        ):
+        if self._state in _MOVING_STATES:
             self.update_status()
-            if self._state not in (XYScreensState.UP, XYScreensState.DOWN):
-                self._state = XYScreensState.STOPPED
+            if self._state not in _END_STATES:
+                self._state = _STATE_STOPPED
+            self._last_emitted = None
             return True
 
         return False
@@ -386,23 +696,40 @@ class XYScreens:
 
         await self._cancel_set_position()
 
-        if await self._async_send_command(self._commands.stop()) and self._post_stop():
+        if await self._async_send_command(self._commands.stop(), True):
+            return self._post_async_stop()
+
+        return False
+
+    def _post_async_stop(self) -> bool:
+        # Only a screen that was moving has a stop to report.
+        if self._post_stop():
             self._update_callbacks()
             return True
 
         return False
 
     def _post_down(self) -> bool:
-        if self._state not in (XYScreensState.DOWNWARD, XYScreensState.DOWN):
-            self.update_status()
-            self._state = XYScreensState.DOWNWARD
-            return True
+        state = self._state
+        if state in _DOWN_STATES:
+            return False
 
-        return False
+        # Only a screen that was moving up has a position that needs updating.
+        if state == _STATE_UPWARD:
+            self.update_status()
+        self._state = _STATE_DOWNWARD
+        self._last_emitted = None
+        # Calculate when the screen will be totally down.
+        self._end_position_time = self._clock() + int((100.0 - self._position) / self._down_speed)
+        return True
 
     def down(self) -> bool:
         "Move the screen down."
 
+        # Don't repeat the command while the screen is already moving down.
+        if self._state == _STATE_DOWNWARD:
+            return False
+
         if self._send_command(self._commands.down()):
             return self._post_down()
 
@@ -423,38 +750,70 @@ class XYScreens:
 
         return await self._async_send_command(self._commands.micro_down())
 
-    def _target_position_reached(self, target_position: float) -> bool:
+    @staticmethod
+    def _target_position_reached(
+        state: XYScreensState, position: float, target_position: float
+    ) -> bool:
         """Calculates if the target position has been reached."""
-        self.update_status()
-
-        if self._state == XYScreensState.DOWNWARD:
-            return self._position >= target_position
-        if self._state == XYScreensState.UPWARD:
-            return self._position <= target_position
+        if state == _STATE_DOWNWARD:
+            return position >= target_position
+        if state == _STATE_UPWARD:
+            return position <= target_position
 
         # Target position has been reached
         return True
 
+    def _at_target_position(self, target_position: float) -> bool:
+        """Checks if the screen is within half a percent of the target position."""
+        return abs(self._position - target_position) < 0.5
+
+    def _time_to_target_position(self, target_position: float) -> float:
+        """Calculates the time in seconds until the target position is reached."""
+        if self._state == _STATE_DOWNWARD:
+            return (target_position - self._position) / self._down_speed / 1000000000
+        if self._state == _STATE_UPWARD:
+            return (self._position - target_position) / self._up_speed / 1000000000
+
+        return 0.0
+
+    def _poll_interval(self, target_position: float, min_interval: float) -> float:
+        """
+        Returns how long to sleep before checking the position again.
+
+        Sleeps until the target position is expected to be reached, but no longer than
+        _MAX_POLL_INTERVAL so position updates keep flowing.
+        """
+        return max(
+            min_interval, min(self._time_to_target_position(target_position), _MAX_POLL_INTERVAL)
+        )
+
     def set_position(self, target_position: float) -> bool:
         """Initiates the screen to move to a given position."""
         assert 0.0 <= target_position <= 100.0
 
-        if round(self._position) == round(target_position):
+        self.update_status()
+        if self._at_target_position(target_position):
             return self.stop()
 
-        if self._position < target_position and not self.down():
-            return False
-        if self._position > target_position and not self.up():
-            return False
+        # Only send a command when the screen isn't already moving in the right direction.
+        if self._position < target_position:
+            if self._state != _STATE_DOWNWARD and not self.down():
+                return False
+        elif self._position > target_position:
+            if self._state != _STATE_UPWARD and not self.up():
+                return False
 
         sleep_duration = min(self._up_duration, self._down_duration) / 1000.0
         while True:
-            if self._target_position_reached(target_position):
-                if self._state in (XYScreensState.UPWARD, XYScreensState.DOWNWARD):
+            (state, position) = self.update_status()
+            if self._target_position_reached(state, position, target_position):
+                if state in _MOVING_STATES:
                     self.stop()
                 break
 
-            time.sleep(sleep_duration)
+            # Nothing needs to be reported while moving, sleep till the target position is
+            # expected to be reached and check again in case the sleep ended early.
+            time.sleep(max(sleep_duration, self._time_to_target_position(target_position)))
 
         return True
 
@@ -462,76 +821,171 @@ class XYScreens:
         """Initiates the screen to move to a given position."""
         assert 0.0 <= target_position <= 100.0
 
-        if round(self._position) == round(target_position):
-            return await self.async_stop()
-
         await self._cancel_set_position()
 
+        command = self._set_position_command(target_position)
+        if command is not None and not await self._async_send_command(
+            command, command == self._commands.stop()
+        ):
+            return False
+
+        return self._post_set_position(command, target_position)
+
+    def _set_position_command(self, target_position: float) -> bytes | None:
+        # The command that moves the screen to the target position, stop when the screen is
+        # already there and None when the screen is already moving in the right direction.
+        if self._at_target_position(target_position):
+            return self._commands.stop()
         if self._position < target_position:
-            if not await self._async_send_command(self._commands.down()):
-                return False
-            self._post_down()
-        elif self._position > target_position:
-            if not await self._async_send_command(self._commands.up()):
-                return False
-            self._post_up()
+            if self._state != _STATE_DOWNWARD:
+                return self._commands.down()
+        elif self._state != _STATE_UPWARD:
+            return self._commands.up()
+
+        return None
+
+    def _post_set_position(self, command: bytes | None, target_position: float) -> bool:
+        # Updates the state after the command given by _set_position_command has been written.
+        if command == self._commands.stop():
+            return self._post_async_stop()
+        if command is not None:
+            # The screen starts moving, report that right away.
+            if command == self._commands.down():
+                self._post_down()
+            else:
+                self._post_up()
+            self._update_callbacks()
 
+        # Follow the screen till it reaches the target position.
         self._set_position_task = asyncio.create_task(
             self._set_position_coroutine(target_position)
         )
-
-        _add_background_task(self._set_position_task)
+        self._add_background_task(self._set_position_task)
 
         return True
 
-    async def _cancel_set_position(self) -> bool:
-        if self._set_position_task is not None and not (
-            self._set_position_task.done() or self._set_position_task.cancelled()
-        ):
-            if not self._set_position_task.cancel():
-                logger.error("Failed to cancel set position task")
-                logger.debug("Set position task: %s", self._set_position_task)
-                return False
-            try:
-                await self._set_position_task
-            except asyncio.CancelledError:
-                logger.debug("Set position task was cancelled")
-
-        if self._set_position_task is not None:
-            if self._set_position_task.done() or self._set_position_task.cancelled():
-                self._set_position_task = None
-            else:
-                logger.error("Failed to cancel set position task")
-                logger.debug("Set position task: %s", self._set_position_task)
-                return False
+    async def async_wait_for_position(self) -> None:
+        """
+        Waits till the screen has reached the position it was set to move to by one of the async
+        methods, or till it was stopped. Returns immediately if the screen is not moving.
+        """
+        self._bind_loop()
+        if self._set_position_task is not None and not self._set_position_task.done():
+            # Don't use await on the task itself, being cancelled would also cancel the task.
+            await asyncio.wait({self._set_position_task})
 
+    async def _cancel_set_position(self) -> bool:
+        self._bind_loop()
+        task = self._set_position_task
+        self._set_position_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            # Wait for the task to finish, the set position coroutine handles the cancellation.
+            await asyncio.gather(task, return_exceptions=True)
+
+        # Refresh the status even when there's nothing to cancel. Without a set position task
+        # nothing kept the position up to date, while the callers base their next command on it.
         self.update_status()
         self._update_callbacks()
 
-        return self._set_position_task is None
+        return True
 
     async def _set_position_coroutine(self, target_position: float):
         sleep_duration = min(self._up_duration, self._down_duration) / 1000.0
+        # The direction doesn't change while moving to the target position, if the screen is no
+        # longer moving in that direction it has been stopped or reached its end position.
+        going_down = self._state == _STATE_DOWNWARD
         while True:
             try:
-                target_position_reached = self._target_position_reached(target_position)
+                (state, position) = self.update_status()
+                if going_down:
+                    target_position_reached = (
+                        state != _STATE_DOWNWARD or position >= target_position
+                    )
+                else:
+                    target_position_reached = state != _STATE_UPWARD or position <= target_position
 
                 self._update_callbacks()
 
                 if target_position_reached:
-                    if self._state in (
-                        XYScreensState.UPWARD,
-                        XYScreensState.DOWNWARD,
-                    ) and await self._async_send_command(self._commands.stop()):
+                    if state in _MOVING_STATES and await self._async_send_command(
+                        self._commands.stop(), True
+                    ):
                         self._post_stop()
                         self._update_callbacks()
                     break
 
-                await asyncio.sleep(sleep_duration)
+                await asyncio.sleep(self._poll_interval(target_position, sleep_duration))
             except asyncio.CancelledError:
                 logger.debug("Set position task was canceled")
                 break
 
+    @classmethod
+    async def async_broadcast(
+        cls, screens: Iterable["XYScreens"], command: Callable[[XYScreensCommands], bytes]
+    ) -> bool:
+        """
+        Sends the same command to multiple screens at the same time.
+
+        The command is one of XYScreensCommands.up, down, stop, micro_up or micro_down. Every
+        screen is handled as by the async method of the same name. Returns True if all screens
+        accepted the command.
+
+        Screens on the same serial port share an RS-485 bus, their commands are combined into a
+        single write on the connection of one of these screens. Screens on different serial
+        ports are commanded concurrently.
+        """
+        assert command in _BROADCAST_COMMANDS
+
+        # pylint: disable=protected-access
+        # Group the screens by the serial port, and thus the bus, they are connected to.
+        buses: dict[str, list[XYScreens]] = {}
+        for screen in screens:
+            buses.setdefault(screen._serial_port, []).append(screen)
+
+        results = await asyncio.gather(
+            *(cls._async_broadcast_bus(bus_screens, command) for bus_screens in buses.values())
+        )
+
+        return all(results)
+
+    @staticmethod
+    async def _async_broadcast_bus(
+        screens: list["XYScreens"], command: Callable[[XYScreensCommands], bytes]
+    ) -> bool:
+        # pylint: disable=protected-access
+        stop = command is XYScreensCommands.stop
+        target_position = _BROADCAST_COMMANDS[command]
+        if stop or target_position is not None:
+            # The screens no longer move to the position they were set to.
+            for screen in screens:
+                await screen._cancel_set_position()
+
+        frames: list[bytes | None]
+        if target_position is not None:
+            # Up and down move the screens to their end position, as async_up and async_down do.
+            frames = [screen._set_position_command(target_position) for screen in screens]
+        else:
+            frames = [command(screen._commands) for screen in screens]
+
+        # Write the commands for all screens on the bus at once.
+        data = b"".join(frame for frame in frames if frame is not None)
+        if data and not await screens[0]._async_send_command(data, stop):
+            return False
+
+        # Update the state of every screen before looking at the results.
+        if stop:
+            results = [screen._post_async_stop() for screen in screens]
+        elif target_position is not None:
+            results = [
+                screen._post_set_position(frame, target_position)
+                for screen, frame in zip(screens, frames)
+            ]
+        else:
+            return True
+
+        return all(results)
+
     def state(self) -> XYScreensState:
         "Returns the current state of the screen."
         (state, _) = self.update_status()
@@ -545,3 +999,13 @@ class XYScreens:
         (_, position) = self.update_status()
 
         return position
+
+    def time_to_end_position(self) -> float:
+        """
+        Returns the time in seconds it takes the screen to reach the end position it is moving to,
+        0.0 if the screen is not moving.
+        """
+        if self.update_status()[0] in _MOVING_STATES:
+            return max(0.0, (self._end_position_time - self._clock()) / 1000000000)
+
+        return 0.0